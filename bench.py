@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+import sys
+
+from private import Environment
+from paxos.proposer import Propose
+from process import LearnerProcess, PaxosProcess
+from public import ClientProcess
+
+
+def run(env, futures, time_limit):
+    start_time = env.time
+    while not all(future.has_value for future in futures) and env.time - start_time < time_limit:
+        env.step_randomly()
+
+
+def run_rounds(env, futures, round_limit):
+    # in a round every process ticks once and then all messages in flight are delivered
+    rounds = 0
+    while not all(future.has_value for future in futures) and rounds < round_limit:
+        for process in env.processes:
+            env.step_by_ticking_process(process)
+        for process in env.processes:
+            env.step_by_delivering_messages(process, direction="incoming")
+        rounds += 1
+    return rounds
+
+
+def serving_at_most(cls, capacity):
+    class CapacityLimited(cls):
+        def on_tick(self, ctx):
+            deferred = self.client_requests[capacity:]
+            self.client_requests = self.client_requests[:capacity]
+            super(CapacityLimited, self).on_tick(ctx)
+            self.client_requests = deferred + self.client_requests
+    return CapacityLimited
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def timing_phases(cls, times):
+    class PhaseTimed(cls):
+        def process_internal_request(self, ctx, sender, key, msg):
+            super(PhaseTimed, self).process_internal_request(ctx, sender, key, msg)
+            # the first time each point is reached by any process
+            if isinstance(msg, Propose):
+                times.setdefault("proposed", ctx.time)
+            proposer = self.proposers[key]
+            if len(proposer.prepared) >= proposer.quorum:
+                times.setdefault("prepared", ctx.time)
+            if self.learners[key].chosen_value is not None:
+                times.setdefault("learned", ctx.time)
+    return PhaseTimed
+
+
+def measure_phase_latencies(args, phase1_quorum, phase2_quorum, seed):
+    env = Environment(seed=seed)
+    client = env.spawn_process(ClientProcess)  # type: ClientProcess
+    times = {}
+    process_cls = timing_phases(PaxosProcess, times)
+    processes = [
+        env.spawn_process(process_cls, phase1_quorum=phase1_quorum, phase2_quorum=phase2_quorum)
+        for _ in range(args.members)
+    ]
+    env.setup()
+
+    result = client.call(processes[0].pid, "set", key="the-key", value="the-value")
+    env.step_by_ticking_process(client)
+    run(env, [result], args.time_limit)
+    if not result.has_value:
+        return None
+    # phase 1 runs from the Propose to the Q1-th Prepared, phase 2 from the Accepts it sends to the Q2-th Learn
+    return times["prepared"] - times["proposed"], times["learned"] - times["prepared"]
+
+
+def bench_quorums(args):
+    """simulated time spent in phase 1 (Propose to Q1 Prepared) and in phase 2 (Accept to Q2 Learn)
+    of a set for every phase 1 / phase 2 quorum split"""
+    print("%-8s %-4s %-4s %-8s %-15s %-15s %-15s %-15s" % ("members", "q1", "q2", "runs",
+                                                           "phase 1 mean", "phase 1 median",
+                                                           "phase 2 mean", "phase 2 median"))
+    for phase1_quorum in range(args.members, 0, -1):
+        phase2_quorum = args.members + 1 - phase1_quorum
+        latencies = []
+        for seed in range(args.repeat):
+            latency = measure_phase_latencies(args, phase1_quorum, phase2_quorum, seed)
+            if latency is not None:
+                latencies.append(latency)
+        if not latencies:
+            print("%-8d %-4d %-4d %-8d %-15s %-15s %-15s %-15s" % (args.members, phase1_quorum, phase2_quorum,
+                                                                   0, "-", "-", "-", "-"))
+            continue
+        columns = []
+        for phase in zip(*latencies):
+            columns.extend([float(sum(phase)) / len(phase), median(phase)])
+        print("%-8d %-4d %-4d %-8d %-15.1f %-15d %-15.1f %-15d" % ((args.members, phase1_quorum, phase2_quorum,
+                                                                    len(latencies)) + tuple(columns)))
+
+
+def bench_replicas(args):
+    """reads served per round by the members and a growing number of learner replicas,
+    each process answering at most --capacity client requests per tick"""
+    print("%-8s %-9s %-11s %-8s %-13s" % ("members", "replicas", "set rounds", "reads", "reads/round"))
+    for replica_count in range(args.max_replicas + 1):
+        env = Environment()
+        client = env.spawn_process(ClientProcess)  # type: ClientProcess
+        members = range(1, args.members + 1)
+        replicas = range(args.members + 1, args.members + 1 + replica_count)
+        member_cls = serving_at_most(PaxosProcess, args.capacity)
+        replica_cls = serving_at_most(LearnerProcess, args.capacity)
+        for _ in members:
+            env.spawn_process(member_cls, members=members, learner_replicas=replicas)
+        for _ in replicas:
+            env.spawn_process(replica_cls, members=members)
+        env.setup()
+
+        result = client.call(members[0], "set", key="the-key", value="the-value")
+        set_rounds = run_rounds(env, [result], args.time_limit)
+        if not result.has_value:
+            print("%-8d %-9d %-11s %-8s %-13s" % (args.members, replica_count, "-", "-", "-"))
+            continue
+
+        servers = list(members) + list(replicas)
+        results = [
+            client.call(servers[i % len(servers)], "get", key="the-key")
+            for i in range(args.reads)
+        ]
+        read_rounds = run_rounds(env, results, args.time_limit)
+        served = len([result for result in results if result.has_value])
+        print("%-8d %-9d %-11d %-8d %-13.1f" % (args.members, replica_count, set_rounds,
+                                                served, float(served) / read_rounds))
+
+
+BENCHMARKS = {
+    "quorums": bench_quorums,
+    "replicas": bench_replicas,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS),
+                        help="benchmark to run")
+    parser.add_argument("-m", "--members", metavar="N", type=int, default=5,
+                        help="number of voting processes")
+    parser.add_argument("--max-replicas", metavar="N", type=int, default=6,
+                        help="largest number of learner replicas to try")
+    parser.add_argument("--reads", metavar="N", type=int, default=1000,
+                        help="number of gets issued after the set")
+    parser.add_argument("--capacity", metavar="N", type=int, default=10,
+                        help="client requests a process answers per tick")
+    parser.add_argument("-r", "--repeat", metavar="N", type=int, default=200,
+                        help="number of simulated runs per configuration")
+    parser.add_argument("-t", "--time-limit", metavar="T", type=int, default=5000,
+                        help="simulated time (or rounds) after which a run is abandoned")
+    args = parser.parse_args()
+
+    logging.disable(logging.DEBUG)
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,13 @@
 
 import argparse
 import importlib
+import inspect
 import logging
 import sys
 import unittest
 
 from private import Environment
-from public import ClientProcess, Process
+from public import ClientProcess, ClientProtocol, Process
 
 
 def await(env, *futures, **kwargs):
@@ -136,6 +137,332 @@ class ThreeProcessConcurrentSetsTestCase(BaseTestCase):
             self.assertEqual(result.get_value()["value"], decided_value)
 
 
+class ThreeProcessForkedBranchesTestCase(BaseTestCase):
+    """check that branches forked from a warmed-up cluster diverge independently"""
+
+    def runTest(self):
+        n = 3
+
+        env = Environment()
+        client = env.spawn_process(ClientProcess)  # type: ClientProcess
+        processes = [env.spawn_process(self.impl_cls) for _ in range(n)]
+        env.setup()
+
+        result = client.call(processes[0].pid, "set", key="the-key", value="the-value")
+        env.step_by_ticking_process(client)
+        env.step_by_delivering_messages(client)
+        await(env, result)
+
+        snapshot = env.snapshot()
+        for victim in processes:
+            branch = env.fork()
+            branch.kill_process(victim.pid)
+            branch_client = branch.processes[client.pid]  # type: ClientProcess
+            results = [
+                branch_client.call(process.pid, "set", key="the-key", value="the-other-value")
+                for process in processes if process is not victim
+            ]
+            branch.step_by_ticking_process(branch_client)
+            branch.step_by_delivering_messages(branch_client)
+            await(branch, *results)
+
+            for result in results:
+                if result.has_value:
+                    self.assertEqual(result.get_value()["value"], "the-value")
+                    self.assertEqual(result.get_value()["flag"], False)
+            self.assertNotIn(victim.pid, env.dead_processes)
+
+        times = []
+        for _ in range(2):
+            env.restore(snapshot)
+            restored_client = env.processes[client.pid]  # type: ClientProcess
+            result = restored_client.call(processes[1].pid, "get", key="the-key")
+            env.step_by_ticking_process(restored_client)
+            env.step_by_delivering_messages(restored_client)
+            await(env, result)
+            self.assertEqual(result.get_value()["value"], "the-value")
+            times.append(env.time)
+        self.assertEqual(times[0], times[1])
+
+
+class RecordingClientProcess(ClientProcess):
+    def __init__(self, pid):
+        super(RecordingClientProcess, self).__init__(pid)
+        self.responses = []
+
+    def on_receive(self, ctx, sender, message):
+        self.responses.append(dict(message))
+        super(RecordingClientProcess, self).on_receive(ctx, sender, message)
+
+
+class UncoordinatedProcess(Process):
+    """a broken store deciding every set locally, which the explorer must catch"""
+
+    def __init__(self, pid):
+        super(UncoordinatedProcess, self).__init__(pid)
+        self._store = {}
+        self._requests = []
+
+    def on_setup(self, process_count):
+        pass
+
+    def on_tick(self, ctx):
+        CP = ClientProtocol
+        for sender, message in self._requests:
+            value = self._store.setdefault(message[CP.KEY], message.get(CP.VALUE))
+            answer = {CP.ID: message[CP.ID], CP.VALUE: value}
+            if message[CP.METHOD] == "set":
+                answer[CP.FLAG] = value == message[CP.VALUE]
+            ctx.send(sender, answer)
+        self._requests = []
+
+    def on_receive(self, ctx, sender, message):
+        self._requests.append((sender, message))
+
+
+def start_concurrent_sets(impl_cls, n, **kwargs):
+    env = Environment()
+    client = env.spawn_process(RecordingClientProcess)  # type: RecordingClientProcess
+    processes = [env.spawn_process(impl_cls, **kwargs) for _ in range(n)]
+    env.setup()
+
+    for i, process in enumerate(processes[:2]):
+        client.call(process.pid, "set", key="the-key", value="the-value-%s" % i)
+    env.step_by_ticking_process(client)
+    return env, client
+
+
+def sets_agree(client):
+    def invariant(env):
+        responses = env.processes[client.pid].responses
+        values = set(response[ClientProtocol.VALUE] for response in responses)
+        flags = [response for response in responses if response.get(ClientProtocol.FLAG)]
+        return len(values) <= 1 and len(flags) <= 1
+    return invariant
+
+
+class ThreeProcessExploredConcurrentSetsTestCase(BaseTestCase):
+    """check that concurrent sets agree on the decided value in every schedule with few delays"""
+
+    def runTest(self):
+        env, client = start_concurrent_sets(self.impl_cls, 3)
+
+        result = env.explore(sets_agree(client), max_depth=60, max_states=20000, max_delays=2)
+        self.assertIsNone(result.trace, "invariant violated after %s" % result.trace)
+        self.assertTrue(result.complete, "only %d states explored" % result.states)
+
+
+def accepts_arguments(cls, *names):
+    return all(name in inspect.getargspec(cls.__init__).args for name in names)
+
+
+class ThreeProcessFlexibleQuorumsTestCase(BaseTestCase):
+    """check that concurrent sets agree with uneven phase 1 and phase 2 quorums"""
+
+    def runTest(self):
+        if not accepts_arguments(self.impl_cls, "members", "phase1_quorum", "phase2_quorum"):
+            self.skipTest("implementation has no configurable quorums")
+        for phase1_quorum, phase2_quorum in [(1, 3), (3, 1), (2, 2)]:
+            env, client = start_concurrent_sets(self.impl_cls, 3, members=[1, 2, 3],
+                                                phase1_quorum=phase1_quorum, phase2_quorum=phase2_quorum)
+
+            result = env.explore(sets_agree(client), max_depth=100, max_states=20000, max_delays=2)
+            self.assertIsNone(result.trace, "invariant violated with quorums %d/%d after %s"
+                              % (phase1_quorum, phase2_quorum, result.trace))
+            self.assertTrue(result.complete, "only %d states explored" % result.states)
+
+
+class ThreeProcessNonIntersectingQuorumsTestCase(BaseTestCase):
+    """check that quorums which may miss each other are rejected"""
+
+    def runTest(self):
+        if not accepts_arguments(self.impl_cls, "phase1_quorum", "phase2_quorum"):
+            self.skipTest("implementation has no configurable quorums")
+        env = Environment()
+        env.spawn_process(ClientProcess)
+        for _ in range(3):
+            env.spawn_process(self.impl_cls, phase1_quorum=1, phase2_quorum=2)
+        self.assertRaises(ValueError, env.setup)
+
+
+class ProposerRunsPhase2OnceTestCase(BaseTestCase):
+    """check that replies arriving after the phase 1 quorum do not start phase 2 again"""
+
+    def runTest(self):
+        proposer_cls = getattr(sys.modules[self.impl_cls.__module__], "Proposer", None)
+        if proposer_cls is None:
+            self.skipTest("implementation has no Proposer")
+        proposer = proposer_cls((1, 2, 3), 1)
+        prepares = list(proposer.on_propose(5, "the-value"))
+        self.assertEqual(len(prepares), 3)
+        round_id = prepares[0].round_id
+
+        accepts = list(proposer.on_prepared(1, round_id, -1, None))
+        self.assertEqual(len(accepts), 3)
+        for accept in accepts:
+            self.assertEqual((accept.round_id, accept.value), (round_id, "the-value"))
+
+        # a late reply carrying an older vote must not propose that vote in the same round
+        self.assertEqual(list(proposer.on_prepared(2, round_id, 3, "the-older-value")), [])
+        self.assertEqual(list(proposer.on_prepared(3, round_id, -1, None)), [])
+        # neither may the same request proposed again, e.g. forwarded twice by a learner replica
+        self.assertEqual(list(proposer.on_propose(5, "the-value")), [])
+
+
+def learner_replica_class(impl_cls):
+    return getattr(sys.modules[impl_cls.__module__], "LearnerProcess", None)
+
+
+class ThreeProcessLearnerReplicasTestCase(BaseTestCase):
+    """check that learner replicas serve the decided value and forward sets to the members"""
+
+    def runTest(self):
+        replica_cls = learner_replica_class(self.impl_cls)
+        if replica_cls is None or not accepts_arguments(self.impl_cls, "learner_replicas"):
+            self.skipTest("implementation has no learner replicas")
+        members, replicas = [1, 2, 3], [4, 5]
+
+        env = Environment()
+        client = env.spawn_process(ClientProcess)  # type: ClientProcess
+        for _ in members:
+            env.spawn_process(self.impl_cls, learner_replicas=replicas)
+        for _ in replicas:
+            env.spawn_process(replica_cls, members=members)
+        env.setup()
+
+        proposals = ["the-value-0", "the-value-1"]
+        results = [
+            client.call(replicas[0], "set", key="the-key", value=proposals[0]),
+            client.call(members[1], "set", key="the-key", value=proposals[1]),
+        ]
+        env.step_by_ticking_process(client)
+        await(env, *results)
+
+        for result in results:
+            self.assertTrue(result.has_value)
+        decided_values = set(result.get_value()["value"] for result in results)
+        self.assertEqual(len(decided_values), 1)
+        decided_value = decided_values.pop()
+        self.assertIn(decided_value, proposals)
+
+        results = [client.call(pid, "get", key="the-key") for pid in members + replicas]
+        env.step_by_ticking_process(client)
+        env.step_by_delivering_messages(client)
+        await(env, *results)
+
+        for result in results:
+            self.assertEqual(result.get_value()["value"], decided_value)
+
+
+class ThreeProcessReplicaQuorumTestCase(BaseTestCase):
+    """check that learner replicas wait for the phase 2 quorum of the members"""
+
+    def runTest(self):
+        replica_cls = learner_replica_class(self.impl_cls)
+        if replica_cls is None or not accepts_arguments(self.impl_cls, "phase1_quorum", "phase2_quorum",
+                                                        "learner_replicas"):
+            self.skipTest("implementation has no learner replicas with configurable quorums")
+        members, replicas = [1, 2, 3], [4]
+
+        env = Environment()
+        client = env.spawn_process(ClientProcess)  # type: ClientProcess
+        for _ in members:
+            env.spawn_process(self.impl_cls, phase1_quorum=1, phase2_quorum=3, learner_replicas=replicas)
+        for _ in replicas:
+            env.spawn_process(replica_cls, members=members)
+        env.setup()
+        env.kill_process(members[2])
+
+        # two votes are a majority but not a phase 2 quorum, so nothing may be learned
+        results = [
+            client.call(members[0], "set", key="the-key", value="the-value"),
+            client.call(replicas[0], "get", key="the-key"),
+        ]
+        env.step_by_ticking_process(client)
+        while env.time < 200:
+            env.step_randomly()
+        for result in results:
+            self.assertFalse(result.has_value)
+
+
+class ThreeProcessReplicaForwardingTestCase(BaseTestCase):
+    """check that a set sent to a learner replica is decided whichever member has died"""
+
+    def runTest(self):
+        replica_cls = learner_replica_class(self.impl_cls)
+        if replica_cls is None or not accepts_arguments(self.impl_cls, "learner_replicas"):
+            self.skipTest("implementation has no learner replicas")
+        members, replicas = [1, 2, 3], [4]
+
+        for victim in members:
+            env = Environment()
+            client = env.spawn_process(ClientProcess)  # type: ClientProcess
+            for _ in members:
+                env.spawn_process(self.impl_cls, learner_replicas=replicas)
+            for _ in replicas:
+                env.spawn_process(replica_cls, members=members)
+            env.setup()
+            env.kill_process(victim)
+
+            result = client.call(replicas[0], "set", key="the-key", value="the-value")
+            env.step_by_ticking_process(client)
+            await(env, result, time_limit=2000)
+
+            self.assertEqual(result.get_value()["value"], "the-value")
+            self.assertEqual(result.get_value()["flag"], True)
+
+
+class ThreeProcessOverlappingReplicasTestCase(BaseTestCase):
+    """check that a process cannot be both a member and a learner replica"""
+
+    def runTest(self):
+        if not accepts_arguments(self.impl_cls, "members", "learner_replicas"):
+            self.skipTest("implementation has no learner replicas")
+        env = Environment()
+        env.spawn_process(ClientProcess)
+        for _ in range(3):
+            env.spawn_process(self.impl_cls, members=[1, 2, 3], learner_replicas=[3])
+        self.assertRaises(ValueError, env.setup)
+
+
+class ExploreFindsViolationTestCase(BaseTestCase):
+    """check that the explorer finds and replays a schedule breaking a broken implementation"""
+
+    def runTest(self):
+        env, client = start_concurrent_sets(UncoordinatedProcess, 3)
+        invariant = sets_agree(client)
+
+        result = env.explore(invariant, max_depth=60, max_states=20000, max_delays=2)
+        self.assertIsNotNone(result.trace)
+        self.assertTrue(invariant(env))
+        for action in result.trace:
+            env.step(action)
+        self.assertFalse(invariant(env))
+
+
+def reached_states(env, **kwargs):
+    states = set()
+
+    def invariant(env):
+        states.add(env._state_key())
+        return True
+    result = env.explore(invariant, **kwargs)
+    return states, result.complete
+
+
+class ExploreSleepSetsTestCase(BaseTestCase):
+    """check that the reduced search reaches the same states as the unreduced one"""
+
+    def runTest(self):
+        for max_delays in [1, 2, None]:
+            env, client = start_concurrent_sets(UncoordinatedProcess, 3)
+            reduced = reached_states(env, max_depth=60, max_states=20000, max_delays=max_delays)
+            unreduced = reached_states(env, max_depth=60, max_states=20000, max_delays=max_delays,
+                                       sleep_sets=False)
+            self.assertEqual(reduced, unreduced)
+            self.assertTrue(reduced[1])
+
+
 def load_impl(path):
     parts = path.split(".")
     if len(parts) != 2:
@@ -170,6 +497,17 @@ def main():
         OneProcessSetGetTestCase(impl_cls),
         ThreeProcessLearnSameValueTestCase(impl_cls),
         ThreeProcessConcurrentSetsTestCase(impl_cls),
+        ThreeProcessForkedBranchesTestCase(impl_cls),
+        ThreeProcessExploredConcurrentSetsTestCase(impl_cls),
+        ExploreFindsViolationTestCase(impl_cls),
+        ExploreSleepSetsTestCase(impl_cls),
+        ThreeProcessFlexibleQuorumsTestCase(impl_cls),
+        ThreeProcessNonIntersectingQuorumsTestCase(impl_cls),
+        ProposerRunsPhase2OnceTestCase(impl_cls),
+        ThreeProcessLearnerReplicasTestCase(impl_cls),
+        ThreeProcessReplicaQuorumTestCase(impl_cls),
+        ThreeProcessReplicaForwardingTestCase(impl_cls),
+        ThreeProcessOverlappingReplicasTestCase(impl_cls),
     ]
 
     if args.grep:
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Tuple
 
 
 class Prepared(object):
@@ -10,17 +10,20 @@ class Prepared(object):
 
 
 class Learn(object):
-    def __init__(self, learner_id, round_id, proposed_round, value):
+    def __init__(self, learner_id, round_id, proposed_round, value, quorum):
         self.learner_id = learner_id
         self.round_id = round_id
         self.proposed_round = proposed_round
         self.value = value
+        self.quorum = quorum
 
 
 class Acceptor(object):
-    def __init__(self, process_count):
-        # type: (int, int) -> None
-        self.process_count = process_count
+    def __init__(self, learners, quorum):
+        # type: (Tuple[int], int) -> None
+        self.learners = learners
+        # the phase 2 quorum travels with every vote, so learners outside the membership need not know it
+        self.quorum = quorum
         self.promised_round = -1
         self.voted_round = -1
         self.voted_value = -1
@@ -37,5 +40,5 @@ class Acceptor(object):
             return
         self.voted_round = round_id
         self.voted_value = value
-        for learner_id in range(1, self.process_count):
-            yield Learn(learner_id, round_id, proposed_round, value)
+        for learner_id in self.learners:
+            yield Learn(learner_id, round_id, proposed_round, value, self.quorum)
@@ -2,17 +2,17 @@ from collections import defaultdict
 
 
 class Learner(object):
-    def __init__(self, process_count):
-        # type: (int, int) -> None
-        self.process_count = process_count
+    def __init__(self):
+        # type: () -> None
         self.accepted = defaultdict(set)
         self.chosen_value = None
         self.proposed_round = None
         self.requests_queue = []
 
-    def on_learn(self, acceptor_id, round_id, proposed_round, value):
-        # type: (int, str) -> None
-        self.accepted[round_id].add((acceptor_id, value))
-        if len(self.accepted[round_id]) >= self.process_count / 2:
+    def on_learn(self, acceptor_id, round_id, proposed_round, value, quorum):
+        # type: (int, int, int, str, int) -> None
+        # an acceptor may vote for the same round more than once, it still counts once
+        self.accepted[(round_id, value)].add(acceptor_id)
+        if len(self.accepted[(round_id, value)]) >= quorum:
             self.proposed_round = proposed_round
             self.chosen_value = value
@@ -19,33 +19,47 @@ class Accept(object):
 
 
 class Proposer(object):
-    def __init__(self, process_count):
-        # type: (int, int) -> None
-        self.process_count = process_count
+    def __init__(self, acceptors, quorum, index=0):
+        # type: (Tuple[int], int, int) -> None
+        self.acceptors = acceptors
+        self.quorum = quorum
+        # the position of this proposer among the acceptors keeps its rounds apart from other proposers'
+        self.index = index
         self.current_round = -1
         self.current_value = None
         self.prepared = dict()
 
     def on_propose(self, round_id, value):
         # type: (int, str) -> iter[Prepare]
+        # the same request may be proposed by several proposers, each in a round of its own
+        round_id = round_id * len(self.acceptors) + self.index
+        if round_id <= self.current_round:
+            # a newer proposal is already running here, the stale one would only stall it;
+            # the same one again could start phase 2 twice in a round
+            return
         self.current_round = round_id
         self.current_value = value
         self.prepared = dict()
-        for acceptor_id in range(1, self.process_count):
+        for acceptor_id in self.acceptors:
             yield Prepare(acceptor_id, round_id)
 
     def on_prepared(self, acceptor_id, round_id, voted_round, voted_value):
         # type: (int, int, int, str) -> iter[Accept]
         if self.current_round != round_id:
             return
+        # phase 2 runs once per round; later replies could otherwise start it again with an older value
+        if len(self.prepared) >= self.quorum:
+            return
         self.prepared[acceptor_id] = (voted_round, voted_value)
-        if len(self.prepared) >= self.process_count / 2:
+        if len(self.prepared) >= self.quorum:
             latest_round = -1
             for voted_round, voted_value in self.prepared.values():
                 if latest_round < voted_round:
                     latest_round = voted_round
                     self.current_value = voted_value
             proposed_round = latest_round if latest_round != -1 else self.current_round
-            for acceptor_id in self.prepared.keys():
+            # learners report the request of the round, which the clients know
+            proposed_round //= len(self.acceptors)
+            # the phase 2 quorum may be larger than the phase 1 one, so ask every acceptor
+            for acceptor_id in self.acceptors:
                 yield Accept(acceptor_id, self.current_round, proposed_round, self.current_value)
-            self.prepared = dict()
@@ -1,6 +1,8 @@
+import copy
 import json
 import logging
 import random
+import types
 from collections import deque
 
 from public import Context, Process
@@ -11,10 +13,40 @@ except ImportError:
     pass
 
 
+def _freeze(obj):
+    """Converts process state into a hashable value that compares equal for equal states."""
+    if isinstance(obj, dict):
+        return tuple(sorted((_freeze(k), _freeze(v)) for k, v in obj.iteritems()))
+    if isinstance(obj, (list, tuple, deque)):
+        return tuple(_freeze(item) for item in obj)
+    if isinstance(obj, (set, frozenset)):
+        return frozenset(_freeze(item) for item in obj)
+    if isinstance(obj, (types.FunctionType, types.MethodType)):
+        return obj
+    if hasattr(obj, "__getstate__"):
+        return type(obj).__name__, _freeze(obj.__getstate__())
+    if hasattr(obj, "__dict__"):
+        return type(obj).__name__, _freeze(obj.__dict__)
+    return obj
+
+
+class ExplorationResult(object):
+    def __init__(self):
+        self.trace = None  # type: List[Tuple]
+        self.states = 0
+        self.transitions = 0
+        self.delays = None  # type: int
+        self.complete = True
+
+
 class Environment(object):
     processes = None  # type: List[Process]
     channels = None  # type: Dict[Tuple[int, int], deque]
     time = None  # type: int
+    random = None  # type: random.Random
+
+    TICK = "tick"
+    DELIVER = "deliver"
 
     class BoundContext(Context):
         def __init__(self, env, pid):
@@ -33,11 +65,22 @@ class Environment(object):
         def destroy(self):
             self._env = self._pid = None
 
-    def __init__(self):
+    class Snapshot(object):
+        def __init__(self, processes, channels, time, dead_processes, random_state):
+            self.processes = processes
+            self.channels = channels
+            self.time = time
+            self.dead_processes = dead_processes
+            self.random_state = random_state
+
+    def __init__(self, seed=None):
         self.processes = []
         self.dead_processes = []
         self.channels = {}
         self.time = -1
+        self.random = random.Random(seed)
+        # channels whose queues are shared with a snapshot or a fork and must be copied before a change
+        self._shared_channels = set()
 
     def spawn_process(self, cls, *args, **kwargs):
         pid = len(self.processes)
@@ -66,6 +109,40 @@ class Environment(object):
         else:
             raise ValueError("value %r is neither a process nor a pid" % process)
 
+    def _writable_channel(self, channel):
+        queue = self.channels[channel]
+        if channel in self._shared_channels:
+            queue = self.channels[channel] = deque(queue)
+            self._shared_channels.discard(channel)
+        return queue
+
+    def snapshot(self):
+        # type: () -> Environment.Snapshot
+        """Captures processes, channels, time and the random generator. Channel queues are shared
+        with the snapshot and copied on the next change; processes may share their internals too.
+        """
+        self._shared_channels = set(self.channels)
+        return Environment.Snapshot(copy.deepcopy(self.processes), dict(self.channels), self.time,
+                                    list(self.dead_processes), self.random.getstate())
+
+    def restore(self, snapshot):
+        # type: (Environment.Snapshot) -> None
+        """Brings the environment back to the snapshot; processes are replaced with copies,
+        so look them up by pid afterwards. A snapshot can be restored any number of times.
+        """
+        self.processes = copy.deepcopy(snapshot.processes)
+        self.channels = dict(snapshot.channels)
+        self._shared_channels = set(self.channels)
+        self.time = snapshot.time
+        self.dead_processes = list(snapshot.dead_processes)
+        self.random.setstate(snapshot.random_state)
+
+    def fork(self):
+        # type: () -> Environment
+        env = Environment()
+        env.restore(self.snapshot())
+        return env
+
     def kill_process(self, process):
         process = self._get_pid(process)
         self.dead_processes.append(process)
@@ -82,7 +159,7 @@ class Environment(object):
     def _step_receive_from_channel(self, sender, recepient):
         self.time += 1
         receive_time = self.time
-        payload, send_time = self.channels[(sender, recepient)].popleft()
+        payload, send_time = self._writable_channel((sender, recepient)).popleft()
         logging.debug("t=%-5d  pid=%-2d  ->on_receive(from_pid=%d, payload=%s)  # sent at t=%d",
                       self.time, recepient, sender, payload, send_time)
         message = json.loads(payload)
@@ -97,7 +174,7 @@ class Environment(object):
         payload = json.dumps(message)
         logging.debug("t=%-5d  pid=%-2d  send(to_pid=%d, payload=%s)",
                       self.time, sender, recepient, payload)
-        self.channels[(sender, recepient)].append((payload, self.time))
+        self._writable_channel((sender, recepient)).append((payload, self.time))
 
     def step_by_ticking_process(self, process):
         process = self._get_pid(process)
@@ -109,7 +186,7 @@ class Environment(object):
         process = self._get_pid(process)
         if process in self.dead_processes:
             return
-        for channel, queue in self.channels.iteritems():
+        for channel in self.channels.keys():
             sender, recepient = channel
             should_receive = False
             if process == recepient:
@@ -118,7 +195,7 @@ class Environment(object):
                 should_receive |= (direction == "outcoming" or direction == "both")
             if not should_receive:
                 continue
-            while len(queue) > 0:
+            while len(self.channels[channel]) > 0:
                 self._step_receive_from_channel(sender, recepient)
 
     def step_randomly(self):
@@ -136,13 +213,170 @@ class Environment(object):
             logging.debug("t=%-5d [no active channels]", self.time)
             next_action = 0
         else:
-            next_action = random.randint(0, 1)
+            next_action = self.random.randint(0, 1)
         if next_action == 1:
-            channel = random.choice(active_channels)
+            channel = self.random.choice(active_channels)
             self._step_receive_from_channel(*channel)
         if next_action == 0:
             while True:
-                process = random.randint(0, len(self.processes) - 1)
+                process = self.random.randint(0, len(self.processes) - 1)
                 if process not in self.dead_processes:
                     break
             self._step_tick(process)
+
+    def enabled_actions(self):
+        # type: () -> List[Tuple]
+        # processes run their pending work first and the oldest messages are delivered next;
+        # explore treats this order as the default schedule
+        actions = [(Environment.TICK, process) for process in range(len(self.processes))
+                   if process not in self.dead_processes]
+        deliveries = []
+        for channel, queue in self.channels.iteritems():
+            sender, recepient = channel
+            if len(queue) == 0:
+                continue
+            if sender in self.dead_processes or recepient in self.dead_processes:
+                continue
+            deliveries.append((queue[0][1], channel))
+        actions.extend((Environment.DELIVER, sender, recepient) for _, (sender, recepient) in sorted(deliveries))
+        return actions
+
+    def step(self, action):
+        if action[0] == Environment.TICK:
+            self._step_tick(action[1])
+        elif action[0] == Environment.DELIVER:
+            self._step_receive_from_channel(action[1], action[2])
+        else:
+            raise ValueError("unknown action %r" % (action,))
+
+    @staticmethod
+    def _are_independent(a, b):
+        # every step touches the state of exactly one process (the ticked one or the recipient),
+        # pops the head of its incoming channel and appends to the tails of its outgoing channels;
+        # steps of different processes therefore commute and never disable each other
+        return a[-1] != b[-1]
+
+    def _save_state(self):
+        return self.processes, self.channels, self.time, self.dead_processes
+
+    def _load_state(self, state):
+        self.processes, self.channels, self.time, self.dead_processes = state
+        self._shared_channels = set(self.channels)
+
+    def _fork_state(self, state, process):
+        # a step only changes the process it is applied to and the channels (copied on write),
+        # so the other processes can be shared between the parent and the child
+        processes, channels, time, dead_processes = state
+        processes = list(processes)
+        processes[process] = copy.deepcopy(processes[process])
+        return processes, dict(channels), time, list(dead_processes)
+
+    def _state_key(self, frozen_processes=None):
+        # time and send timestamps are left out so that equal states reached by different paths match
+        if frozen_processes is None:
+            frozen_processes = [_freeze(process) for process in self.processes]
+        channels = tuple((channel, tuple(payload for payload, _ in queue))
+                         for channel, queue in sorted(self.channels.iteritems()))
+        return tuple(frozen_processes), channels, tuple(sorted(self.dead_processes))
+
+    def explore(self, invariant, max_depth=100, max_states=None, max_delays=None, sleep_sets=True):
+        # type: (callable, int, int, int, bool) -> ExplorationResult
+        """Model-checks the environment: enumerates tick and delivery orders depth-first,
+        skipping already visited global states, ticks of processes with nothing to do and
+        interleavings that only reorder steps of different processes (sleep sets, unless `sleep_sets`
+        is False), and calls `invariant(env)` in every reached state.
+
+        With `max_delays` the search is repeated with a growing bound on how many times a schedule
+        may deviate from the order of `enabled_actions`, so that schedules close to the default one
+        are tried first instead of exhausting the first deep subtree. Sleep sets are not used then:
+        the reordering they skip may need more delays than the bound allows and never be explored.
+
+        Stops at the first state where the invariant returns False; the result then holds
+        the trace of actions leading to it, replayable with `step`. Otherwise `complete` tells
+        whether every schedule within the last tried delay bound was checked without being cut
+        by `max_depth` or `max_states`. Processes must not depend on `ctx.time` and the invariant
+        must not modify them. The environment is left as it was.
+        """
+        result = ExplorationResult()
+        trace = []
+        delayed = []
+        sleep_sets = sleep_sets and max_delays is None
+
+        def visit(visited, state, frozen_processes, depth, delays, sleep, idle):
+            self._load_state(state)
+            key = self._state_key(frozen_processes)
+            seen = visited.get(key)
+            if seen is not None and seen[0] <= depth and (delays is None or seen[1] >= delays):
+                if seen[2] <= sleep:
+                    return False
+                sleep = sleep & seen[2]
+            visited[key] = (depth, delays, sleep)
+            result.states += 1
+
+            if not invariant(self):
+                result.trace = list(trace)
+                return True
+            if depth >= max_depth or (max_states is not None and result.states >= max_states):
+                result.complete = False
+                return False
+
+            children = []
+            cost = -1
+            for action in self.enabled_actions():
+                if action[0] == Environment.TICK and action[1] in idle:
+                    continue
+                cost += 1
+                if delays is not None and cost > delays:
+                    delayed.append(action)
+                    break
+                if action in sleep:
+                    continue
+                process = action[-1]
+                self._load_state(self._fork_state(state, process))
+                time = self.time
+                self.step(action)
+                child_frozen = list(frozen_processes)
+                child_frozen[process] = _freeze(self.processes[process])
+                result.transitions += 1
+                # a tick that neither changed the process nor sent anything stays a no-op
+                # until the process receives a message, so it is not worth trying again
+                if action[0] == Environment.TICK and self.time == time + 1 \
+                        and child_frozen[process] == frozen_processes[process]:
+                    idle = idle | frozenset([process])
+                    cost -= 1
+                    continue
+                children.append((cost, action, self._save_state(), child_frozen))
+
+            done = set()
+            for cost, action, child, child_frozen in children:
+                if max_states is not None and result.states >= max_states:
+                    result.complete = False
+                    return False
+                child_sleep = frozenset(a for a in sleep | done if Environment._are_independent(a, action)) \
+                    if sleep_sets else frozenset()
+                child_delays = delays - cost if delays is not None else None
+                child_idle = idle - frozenset([action[-1]]) if action[0] == Environment.DELIVER else idle
+                trace.append(action)
+                if visit(visited, child, child_frozen, depth + 1, child_delays, child_sleep, child_idle):
+                    return True
+                trace.pop()
+                done.add(action)
+            return False
+
+        root = self._save_state()
+        try:
+            bounds = range(max_delays + 1) if max_delays is not None else [None]
+            for delays in bounds:
+                result.delays = delays
+                result.complete = True
+                del delayed[:]
+                state = copy.deepcopy(root)
+                frozen_processes = [_freeze(process) for process in state[0]]
+                if visit({}, state, frozen_processes, 0, delays, frozenset(), frozenset()):
+                    break
+                if not delayed or (max_states is not None and result.states >= max_states):
+                    break
+        finally:
+            self._load_state(root)
+        logging.debug("explored %d states and %d transitions", result.states, result.transitions)
+        return result
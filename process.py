@@ -1,3 +1,4 @@
+import copy
 from collections import defaultdict
 from public import Process, ClientProtocol, Context
 from paxos import Proposer, Acceptor, Learner
@@ -24,18 +25,107 @@ def deserialize(msg):
     raise ValueError('Message class %s not found' % msg['cls'])
 
 
-class PaxosProcess(Process):
-    def __init__(self, pid):
+def majority(members):
+    return len(members) // 2 + 1
+
+
+def answer_client_request(ctx, sender, msg, learner):
+    # type: (Context, int, dict, Learner) -> bool
+    if learner.chosen_value is None:
+        return False
+    answer = {CP.ID: msg[CP.ID], CP.VALUE: learner.chosen_value}
+    if msg[CP.METHOD] == 'set':
+        answer[CP.FLAG] = learner.proposed_round == msg[CP.ID]
+    ctx.send(sender, answer)
+    return True
+
+
+class RolesProcess(Process):
+    # names of the attributes holding a defaultdict of roles per key
+    ROLE_MAPS = ()
+
+    def create_roles(self):
+        # keys whose roles are shared with a copy of this process and must be copied before a change
+        self._shared_keys = set()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_shared_keys']
+        for name in self.ROLE_MAPS:
+            state[name] = dict(state[name])
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        roles = [state.pop(name) for name in self.ROLE_MAPS]
+        self.__dict__.update(state)
+        self.create_roles()
+        for name, values in zip(self.ROLE_MAPS, roles):
+            getattr(self, name).update(values)
+
+    def __deepcopy__(self, memo):
+        # the copy shares the roles with this process until either of them changes a key
+        state = self.__getstate__()
+        roles = dict((name, state.pop(name)) for name in self.ROLE_MAPS)
+        state = copy.deepcopy(state, memo)
+        state.update(roles)
+        result = type(self).__new__(type(self))
+        memo[id(self)] = result
+        result.__setstate__(state)
+        for values in roles.values():
+            self._shared_keys.update(values)
+            result._shared_keys.update(values)
+        return result
+
+    def get_roles(self, key):
+        if key in self._shared_keys:
+            self._shared_keys.discard(key)
+            for name in self.ROLE_MAPS:
+                roles = getattr(self, name)
+                if key in roles:
+                    roles[key] = copy.deepcopy(roles[key])
+        return tuple(getattr(self, name)[key] for name in self.ROLE_MAPS)
+
+
+class PaxosProcess(RolesProcess):
+    ROLE_MAPS = ('proposers', 'acceptors', 'learners')
+
+    def __init__(self, pid, members=None, phase1_quorum=None, phase2_quorum=None, learner_replicas=()):
         super(PaxosProcess, self).__init__(pid)
-        self.process_count = 0
-        self.proposers = defaultdict(lambda: Proposer(self.process_count))
-        self.acceptors = defaultdict(lambda: Acceptor(self.process_count))
-        self.learners = defaultdict(lambda: Learner(self.process_count))
+        self.members = tuple(members) if members is not None else None
+        self.learner_replicas = tuple(learner_replicas)
+        self.phase1_quorum = phase1_quorum
+        self.phase2_quorum = phase2_quorum
+        self.create_roles()
         self.client_requests = []
         self.internal_requests = []
 
+    def create_roles(self):
+        super(PaxosProcess, self).create_roles()
+        self.proposers = defaultdict(
+            lambda: Proposer(self.members, self.phase1_quorum, self.members.index(self.pid)))
+        self.acceptors = defaultdict(lambda: Acceptor(self.members + self.learner_replicas, self.phase2_quorum))
+        self.learners = defaultdict(Learner)
+
     def on_setup(self, process_count):
-        self.process_count = process_count
+        if self.members is None:
+            # everyone but the client, which is spawned first, and the learner replicas
+            self.members = tuple(pid for pid in range(1, process_count) if pid not in self.learner_replicas)
+        if set(self.members) & set(self.learner_replicas):
+            raise ValueError('Learner replicas %s must not be members'
+                             % sorted(set(self.members) & set(self.learner_replicas)))
+        if self.pid not in self.members:
+            raise ValueError('Process %d must be one of the members %s' % (self.pid, list(self.members)))
+        member_count = len(self.members)
+        if self.phase1_quorum is None:
+            self.phase1_quorum = majority(self.members)
+        if self.phase2_quorum is None:
+            self.phase2_quorum = majority(self.members)
+        if not (0 < self.phase1_quorum <= member_count and 0 < self.phase2_quorum <= member_count):
+            raise ValueError('Quorum sizes must be between 1 and %d' % member_count)
+        if self.phase1_quorum + self.phase2_quorum <= member_count:
+            raise ValueError('Phase 1 quorum of %d and phase 2 quorum of %d do not intersect among %d members'
+                             % (self.phase1_quorum, self.phase2_quorum, member_count))
 
     def on_tick(self, ctx):
         # type: (Context) -> None
@@ -56,19 +146,12 @@ class PaxosProcess(Process):
             ctx.send(recipient, msg)
 
     def process_client_request(self, ctx, sender, msg):
-        reqid = msg[CP.ID]
-        learner = self.learners[msg[CP.KEY]]
-        if learner.chosen_value is not None:
-            answer = {CP.ID: reqid, CP.VALUE: learner.chosen_value}
-            if msg[CP.METHOD] == 'set':
-                answer[CP.FLAG] = learner.proposed_round == reqid
-            ctx.send(sender, answer)
-        else:
+        if not answer_client_request(ctx, sender, msg, self.learners[msg[CP.KEY]]):
             self.client_requests.append((sender, msg))
 
     def process_internal_request(self, ctx, sender, key, msg):
         # type: (Context, int, object) -> None
-        proposer, acceptor, learner = self.proposers[key], self.acceptors[key], self.learners[key]
+        proposer, acceptor, learner = self.get_roles(key)
         if isinstance(msg, Propose):
             for prepare in proposer.on_propose(msg.round_id, msg.value):
                 self.send(ctx, prepare.acceptor_id, serialize(prepare, key))
@@ -83,7 +166,7 @@ class PaxosProcess(Process):
             for accept in proposer.on_prepared(sender, msg.round_id, msg.voted_round, msg.voted_value):
                 self.send(ctx, accept.acceptor_id, serialize(accept, key))
         elif isinstance(msg, Learn):
-            learner.on_learn(sender, msg.round_id, msg.proposed_round, msg.value)
+            learner.on_learn(sender, msg.round_id, msg.proposed_round, msg.value, msg.quorum)
         else:
             raise NotImplementedError('Message class %s is unknown' % type(msg))
 
@@ -99,3 +182,74 @@ class PaxosProcess(Process):
                 self.internal_requests.append((sender, msg[CP.KEY], deserialize(msg)))
         else:
             raise TypeError('Unexpected message type %s' % type(msg))
+
+
+class LearnerProcess(RolesProcess):
+    """learns decisions from the members and serves reads from them without ever voting;
+    the members must list it in their learner_replicas"""
+
+    ROLE_MAPS = ('learners',)
+    # ticks a forwarded set may stay unanswered before it is forwarded to the next member
+    FORWARD_TIMEOUT = 20
+
+    def __init__(self, pid, members):
+        super(LearnerProcess, self).__init__(pid)
+        self.members = tuple(members)
+        self.create_roles()
+        self.client_requests = []
+        self.internal_requests = []
+        self.next_member = pid
+        # ticks waited by every pending set since it was last forwarded
+        self.forwarded_sets = {}
+
+    def create_roles(self):
+        super(LearnerProcess, self).create_roles()
+        self.learners = defaultdict(Learner)
+
+    def on_setup(self, process_count):
+        pass
+
+    def on_tick(self, ctx):
+        # type: (Context) -> None
+        internal_requests = self.internal_requests
+        self.internal_requests = []
+        for sender, key, msg in internal_requests:
+            learner, = self.get_roles(key)
+            learner.on_learn(sender, msg.round_id, msg.proposed_round, msg.value, msg.quorum)
+        client_requests = self.client_requests
+        self.client_requests = []
+        for sender, msg in client_requests:
+            if answer_client_request(ctx, sender, msg, self.learners[msg[CP.KEY]]):
+                self.forwarded_sets.pop((sender, msg[CP.ID]), None)
+                continue
+            self.client_requests.append((sender, msg))
+            if msg[CP.METHOD] == 'set':
+                self.forwarded_sets[(sender, msg[CP.ID])] += 1
+                if self.forwarded_sets[(sender, msg[CP.ID])] >= self.FORWARD_TIMEOUT:
+                    self.forward_set(ctx, sender, msg)
+
+    def forward_set(self, ctx, sender, msg):
+        # type: (Context, int, dict) -> None
+        # members take turns, so a dead one only delays the sets until they are forwarded again;
+        # members proposing the same set use rounds of their own and cannot choose two values
+        self.forwarded_sets[(sender, msg[CP.ID])] = 0
+        ctx.send(self.members[self.next_member % len(self.members)], msg)
+        self.next_member += 1
+
+    def on_receive(self, ctx, sender, msg):
+        # type: (Context, int, object) -> None
+        if isinstance(msg, dict):
+            if CP.METHOD not in msg:
+                return  # a member answering a forwarded set, the client is answered once it is learned
+            if msg[CP.METHOD] == 'get':
+                self.client_requests.append((sender, msg))
+            elif msg[CP.METHOD] == 'set':
+                self.client_requests.append((sender, msg))
+                self.forward_set(ctx, sender, msg)
+            elif msg[CP.METHOD] == 'internal':
+                learn = deserialize(msg)
+                if not isinstance(learn, Learn):
+                    raise NotImplementedError('Message class %s is unexpected' % type(learn))
+                self.internal_requests.append((sender, msg[CP.KEY], learn))
+        else:
+            raise TypeError('Unexpected message type %s' % type(msg))